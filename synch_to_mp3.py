@@ -9,14 +9,16 @@
 #  --------------------------------------------------------------------------
 #  flac  | encode    | delete     | encode    | tag copy      | nothing     |
 #  --------------------------------------------------------------------------
-#  mp3   | copy      | delete     | copy      | tag copy      | nothing     |
+#  mp3   | copy      | delete     | copy *    | tag copy      | nothing     |
 #  --------------------------------------------------------------------------
 #  other | copy      | delete     |         copy              | copy        |
 #  --------------------------------------------------------------------------
 #
 # Some notes:
 # There must be no mp3 and flac files with the same name in one folder.
+# Symbolic links to files and dirs are followed, except links to a dir's own parents (they would loop).
 # The script writes id3v2.4 UTF-8 encoded tags
+# * Only if the files differ, otherwise just the modification time is copied.
 # Embedded album art is not handled
 
 # Adjust the variables below to your situation
@@ -77,16 +79,74 @@ id3_frames_to_ignore = [
 # Do not edit anything below unless you know what you're doing
 # ####################################################################################
 
+import atexit
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+import hashlib
 from os import scandir
 import os.path
 import shutil
 import subprocess
+import sys
+import threading
 from mutagen import flac, id3, mp3
 
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+print_lock = threading.Lock()
+log_buffer = []
+io_threads = 32
+# Modification times within 2 seconds of each other count as equal, FAT file systems only store even seconds.
+# Finer timestamps on one side would otherwise make unchanged files look changed.
+mtime_tolerance_ns = 2_000_000_000
+assert all(v in id3.Frames for v in vorbis_to_id3_map.values()), \
+    f"{[v for v in vorbis_to_id3_map.values() if v not in id3.Frames]} in vorbis_to_id3_map are not valid frame types"
+vorbis_to_frame_type = {k: id3.Frames[v] for k, v in vorbis_to_id3_map.items()}
+id3_to_vorbis_map = {v: k for k, v in vorbis_to_id3_map.items()}
+ignored_id3_frames = frozenset(id3_frames_to_ignore)
+
 
 def print_if_not_silent(text):
+    """
+    Lines are written in batches of 64, every write to a (windows) console is slow.
+    """
     if not silent:
-        print(text)
+        with print_lock:
+            log_buffer.append(text)
+            if len(log_buffer) >= 64:
+                _write_log()
+
+
+def flush_log():
+    with print_lock:
+        if log_buffer:
+            _write_log()
+
+
+def _write_log():
+    sys.stdout.write('\n'.join(log_buffer) + '\n')
+    sys.stdout.flush()
+    log_buffer.clear()
+
+
+atexit.register(flush_log)
+
+
+def copy_file(source, destination):
+    """
+    Like shutil.copy2. shutil.copyfile lets the os do the copy where it can (sendfile, copy_file_range).
+    On systems that support it the source is dropped from the page cache afterwards, it won't be read again.
+    """
+    shutil.copyfile(source, destination)
+    shutil.copystat(source, destination)
+    if hasattr(os, 'posix_fadvise'):
+        fd = os.open(source, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
 
 
 def get_id3_frame(tag_name, tag_value):
@@ -95,69 +155,75 @@ def get_id3_frame(tag_name, tag_value):
     :param tag_value: str.
     :return: mutagen ID3 frame
     """
-    if tag_name in vorbis_to_id3_map:
-        frame_name = vorbis_to_id3_map[tag_name]
-        assert frame_name in id3.Frames, f"'{frame_name}' in vorbis_to_id3_map is not a valid frame type"
-        frame_type = id3.Frames[frame_name]
-
+    frame_type = vorbis_to_frame_type.get(tag_name)
+    if frame_type:
         return frame_type(encoding=3, text=tag_value)
 
     else:
         return id3.TXXX(encoding=3, desc=tag_name, text=tag_value)
 
 
-def xx_total_correct(tag_thing):
+def id3_xx_total_correct(id3_tags):
     """
     id3 tags combine the 'track/disc-number' and 'track/disc-total' fields in one frame (e.g. 3/14).
 
-    :param tag_thing: mutagen.id3.ID3 object (= mp3.MP3.tags) or flac_like dict
+    :param id3_tags: mutagen.id3.ID3 object (= mp3.MP3.tags)
     :return: corrected tags
     """
-    if type(tag_thing) == id3.ID3:
-
-        if all(x in tag_thing for x in ('TXXX:tracktotal', 'TRCK')):
-            track_numb = tag_thing['TRCK'].text[0]
-            track_tot = tag_thing['TXXX:tracktotal'].text[0]
-            tag_thing.add(id3.TRCK(encoding=3, text=f'{track_numb}/{track_tot}'))
-            tag_thing.delall('TXXX:tracktotal')
-
-        if all(x in tag_thing for x in('TXXX:disctotal', 'TPOS')):
-            track_numb = tag_thing['TPOS'].text[0]
-            track_tot = tag_thing['TXXX:disctotal'].text[0]
-            tag_thing.add(id3.TPOS(encoding=3, text=f'{track_numb}/{track_tot}'))
-            tag_thing.delall('TXXX:disctotal')
-        
-        return tag_thing
-    
-    if type(tag_thing) == dict:
-
-        if 'tracknumber' in tag_thing and '/' in tag_thing['tracknumber'][0]:
-            track_numb, track_tot = tag_thing['tracknumber'][0].split('/')
-            tag_thing['tracknumber'] = [track_numb]
-            tag_thing['tracktotal'] = [track_tot]
-
-        if 'discnumber' in tag_thing and '/' in tag_thing['discnumber'][0]:
-            disc_numb, track_tot = tag_thing['discnumber'][0].split('/')
-            tag_thing['discnumber'] = [disc_numb]
-            tag_thing['disctotal'] = [track_tot]
-
-        return tag_thing
+    if all(x in id3_tags for x in ('TXXX:tracktotal', 'TRCK')):
+        track_numb = id3_tags['TRCK'].text[0]
+        track_tot = id3_tags['TXXX:tracktotal'].text[0]
+        id3_tags.add(id3.TRCK(encoding=3, text=f'{track_numb}/{track_tot}'))
+        id3_tags.delall('TXXX:tracktotal')
 
-    else:
-        raise Exception('What is this thing?')
+    if all(x in id3_tags for x in ('TXXX:disctotal', 'TPOS')):
+        track_numb = id3_tags['TPOS'].text[0]
+        track_tot = id3_tags['TXXX:disctotal'].text[0]
+        id3_tags.add(id3.TPOS(encoding=3, text=f'{track_numb}/{track_tot}'))
+        id3_tags.delall('TXXX:disctotal')
+
+    return id3_tags
+
+
+def dict_xx_total_correct(tag_dict):
+    """
+    Splits combined 'number/total' values (e.g. 3/14) into separate number and total fields.
+
+    :param tag_dict: flac_like dict {'tag_name': ['tag_value', ...]}
+    :return: corrected dict
+    """
+    if 'tracknumber' in tag_dict and '/' in tag_dict['tracknumber'][0]:
+        track_numb, track_tot = tag_dict['tracknumber'][0].split('/')
+        tag_dict['tracknumber'] = [track_numb]
+        tag_dict['tracktotal'] = [track_tot]
+
+    if 'discnumber' in tag_dict and '/' in tag_dict['discnumber'][0]:
+        disc_numb, track_tot = tag_dict['discnumber'][0].split('/')
+        tag_dict['discnumber'] = [disc_numb]
+        tag_dict['disctotal'] = [track_tot]
+
+    return tag_dict
 
 
 def copy_tag_dict_to_mp3(mp3_thing, tag_dict):
     """
+    Replaces the tags of mp3_thing, so tags removed on the left also disappear on the right.
+    Embedded album art is kept as it is.
+
     :param tag_dict: flac_like dict {'tag_name': ['tag_value', ...]}
     :param mp3_thing: mutagen.mp3.MP3 instance
     """
+    new_tags = id3.ID3()
+    if mp3_thing.tags is not None:
+        for frame in mp3_thing.tags.getall('APIC'):
+            new_tags.add(frame)
+
     for t in tag_dict.items():
         frame_to_add = get_id3_frame(t[0], t[1])
-        mp3_thing.tags.add(frame_to_add)
-        
-    mp3_thing.tags = xx_total_correct(mp3_thing.tags)
-    mp3_thing.save()
+        new_tags.add(frame_to_add)
+
+    mp3_thing.tags = id3_xx_total_correct(new_tags)
+    mp3_thing.save(v1=0, v2_version=4)
 
 
 def id3_tags_as_dict(id3_tags):
@@ -165,7 +231,6 @@ def id3_tags_as_dict(id3_tags):
     :param id3_tags: mutagen.id3.ID3 object (= mp3.MP3.tags)
     :return: flac_like dict {'tag_name': ['tag_value', ...]}
     """
-    id3_to_vorbis_map = {v: k for k, v in vorbis_to_id3_map.items()}
     flac_like_dict = {}
 
     for t in id3_tags:
@@ -173,30 +238,54 @@ def id3_tags_as_dict(id3_tags):
         if frame_id in id3_to_vorbis_map:
             key = id3_to_vorbis_map[frame_id]
 
-        elif frame_id in id3_frames_to_ignore:
+        elif frame_id in ignored_id3_frames:
             continue
 
         else:
             try:
                 key = id3_tags[t].desc
             except AttributeError:
-                print(f"Ignored {t} frame in {id3_tags['TPE1']} - {id3_tags['TIT2']}")
+                print_if_not_silent(f"Ignored {t} frame in {id3_tags['TPE1']} - {id3_tags['TIT2']}")
                 continue
 
         try:
             val = [str(x) for x in id3_tags[t].text]
         except AttributeError:
-            print(f"Ignored {t} frame in {id3_tags['TPE1']} - {id3_tags['TIT2']}")
+            print_if_not_silent(f"Ignored {t} frame in {id3_tags['TPE1']} - {id3_tags['TIT2']}")
             continue
 
         flac_like_dict[key] = val
 
-    flac_like_dict = xx_total_correct(flac_like_dict)
+    flac_like_dict = dict_xx_total_correct(flac_like_dict)
 
     return flac_like_dict
 
 
-def flac_to_mp3(input_path, output_path, tag_dict=None):
+def file_fingerprint(path):
+    """
+    :param path: str.
+    :return: blake2b digest of the whole file
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            hasher.update(chunk)
+
+    return hasher.digest()
+
+
+def same_file_content(path_1, path_2):
+    """
+    Compares two files byte for byte, tags and album art included.
+    The files are only read in full if they have the same size.
+    """
+    if os.path.getsize(path_1) != os.path.getsize(path_2):
+        return False
+
+    return file_fingerprint(path_1) == file_fingerprint(path_2)
+
+
+def flac_to_mp3(input_path, output_path, tag_dict):
     """
     Converts flac to mp3 and copies tags.
 
@@ -204,45 +293,135 @@ def flac_to_mp3(input_path, output_path, tag_dict=None):
     :param output_path: str.
     :param tag_dict: flac_like dict {'tag_name': ['tag_value', ...]}
     """
-    flac_options = '-d -s --force-raw-format --endian=little --sign=signed -c'
-    lame_options = '-r --quiet --add-id3v2 --noreplaygain'
+    flac_options = ['-d', '-s', '--force-raw-format', '--endian=little', '--sign=signed', '-c']
+    lame_options = ['-r', '--quiet', '--add-id3v2', '--noreplaygain']
 
-    cp1 = subprocess.run(f'"{flac_prog}" {flac_options} "{input_path}"', capture_output=True)
-    subprocess.run(f'"{lame_prog}" -{lame_quality} {lame_options} "-" "{output_path}"',
-                   input=cp1.stdout, capture_output=False)
+    # flac's output goes straight into lame through an os pipe, the decoded audio never passes through python.
+    p1 = subprocess.Popen([flac_prog, *flac_options, input_path], stdout=subprocess.PIPE)
+    if hasattr(fcntl, 'F_SETPIPE_SZ'):
+        # linux: a 1 MiB pipe instead of the default 64 KiB means far fewer switches between flac and lame
+        try:
+            fcntl.fcntl(p1.stdout.fileno(), fcntl.F_SETPIPE_SZ, 1 << 20)
+        except OSError:
+            pass
+    p2 = subprocess.Popen([lame_prog, f'-{lame_quality}', *lame_options, '-', output_path],
+                          stdin=p1.stdout, stdout=subprocess.DEVNULL)
+    p1.stdout.close()  # so flac gets a SIGPIPE if lame exits early
+    p2.wait()
+    p1.wait()
 
     mp3_thing = mp3.MP3(output_path)
-    if not tag_dict:
-        tag_dict = flac.FLAC(input_path).tags.as_dict()
     copy_tag_dict_to_mp3(mp3_thing, tag_dict)
 
 
-def get_files_dirs(path, level=0):
+def encode_new_flac(input_path, output_path):
+    """
+    Reads the flac tags in the worker process, so they aren't parsed one by one in the parent.
+    """
+    flac_to_mp3(input_path, output_path, flac.FLAC(input_path).tags.as_dict())
+
+
+def encode_all(encode_func, jobs):
+    """
+    Runs the encode jobs in a process pool, one per cpu core.
+    Besides flac and lame, the tag reading and writing with mutagen then also runs in parallel.
+
+    :param encode_func: flac_to_mp3 or encode_new_flac
+    :param jobs: list of argument tuples for encode_func, the input path first
+    """
+    if not jobs:
+        return
+
+    # the default number of workers is the cpu count, capped where windows requires it
+    with ProcessPoolExecutor() as executor:
+        futures = {executor.submit(encode_func, *job): job[0] for job in jobs}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception:
+                # don't wait for the rest of the queue before reporting the error
+                for f in futures:
+                    f.cancel()
+                raise
+            print_if_not_silent(f'encoded {futures[future]}')
+
+
+def io_map(func, *iterables):
+    """
+    Calls func for every item in a thread pool.
+    On a network share each file operation is a round trip, doing many at once hides the latency.
+    """
+    with ThreadPoolExecutor(max_workers=io_threads) as executor:
+        for _ in executor.map(func, *iterables):
+            pass
+
+
+def scan_dir(path, prefix, level):
+    """
+    Scans a single dir.
+
+    :param path: str.
+    :param prefix: str. relative path of this dir plus separator, prepended to the returned keys
+    :param level: int. depth of the subdirs
+    :return: music files, rest files and dirs like get_files_dirs, plus (path, prefix, level) for every subdir
+    """
     music_files = {}
     rest_files = {}
     dir_dict = {}
+    subdirs = []
+    real_path = None
     with scandir(path) as scan:
         for entry in scan:
+            # The entry type comes with the dir listing, only symlinks cost an extra stat call to follow.
+            # Only files need a stat for their mtime, on windows that too comes with the listing.
             if entry.is_dir():
                 if entry.name in dirs_to_ignore:
                     continue
-                dir_dict[entry.name] = level
+                if entry.is_symlink():
+                    # a link to this dir or one of its parents would have us going round in circles
+                    if real_path is None:
+                        real_path = os.path.realpath(path)
+                    target = os.path.realpath(entry.path)
+                    if real_path == target or real_path.startswith(os.path.join(target, '')):
+                        continue
+                rel_path = prefix + entry.name
+                dir_dict[rel_path] = level
+                subdirs.append((entry.path, rel_path + os.sep, level + 1))
+
+            elif entry.is_file():
+                last_mod = entry.stat().st_mtime_ns
+                no_ext, ext = os.path.splitext(entry.name)
+                if ext.lower() in ('.flac', '.mp3'):
+                    music_files[prefix + no_ext] = {'ext': ext, 'last_mod': last_mod}
+                else:
+                    rest_files[prefix + entry.name] = last_mod
+
+    return music_files, rest_files, dir_dict, subdirs
 
-                # let's get recursive
-                sub_music, sub_rest, sub_dirs = get_files_dirs(entry.path, level=level + 1)
-                sub_music = {os.path.join(entry.name, x): y for x, y in sub_music.items()}
-                sub_rest = {os.path.join(entry.name, x): y for x, y in sub_rest.items()}
-                sub_dirs = {os.path.join(entry.name, x): y for x, y in sub_dirs.items()}
+
+def get_files_dirs(path, max_workers=4):
+    """
+    Walks the tree under path. All returned keys are paths relative to path.
+    Dirs are scanned concurrently, which pays off on network shares where every listing is a round trip.
+
+    :param path: str.
+    :param max_workers: int. number of dirs scanned at the same time
+    :return: music files {'rel_path_no_ext': {'ext': str, 'last_mod': int}}, rest files {'rel_path': last_mod},
+        dirs {'rel_path': level}
+    """
+    music_files = {}
+    rest_files = {}
+    dir_dict = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(scan_dir, path, '', 0)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                sub_music, sub_rest, sub_dirs, subdirs = future.result()
                 music_files.update(sub_music)
                 rest_files.update(sub_rest)
                 dir_dict.update(sub_dirs)
-            if entry.is_file():
-                last_mod = entry.stat().st_mtime
-                no_ext, ext = os.path.splitext(entry.name)
-                if ext.lower() in ('.flac', '.mp3'):
-                    music_files[no_ext] = {'ext': ext, 'last_mod': last_mod}
-                else:
-                    rest_files[entry.name] = last_mod
+                pending.update(executor.submit(scan_dir, *x) for x in subdirs)
 
     return music_files, rest_files, dir_dict
 
@@ -252,9 +431,13 @@ class CompResult:
 
         self.base_path_left = left
         self.base_path_right = right
+        # base path plus separator, the relative paths are simply appended to these
+        self._left_prefix = os.path.join(left, '')
+        self._right_prefix = os.path.join(right, '')
 
-        self.music_left, self.rest_left, self.dirs_left = get_files_dirs(left)
-        self.music_right, self.rest_right, self.dirs_right = get_files_dirs(right)
+        # the left side is expected to be a local disk, the right side may well be a network share
+        self.music_left, self.rest_left, self.dirs_left = get_files_dirs(left, max_workers=4)
+        self.music_right, self.rest_right, self.dirs_right = get_files_dirs(right, max_workers=16)
 
         self.dirs_to_copy = {k: v for k, v in self.dirs_left.items() if k not in self.dirs_right}
         self.dirs_to_delete = {k: v for k, v in self.dirs_right.items() if k not in self.dirs_left}
@@ -263,57 +446,50 @@ class CompResult:
         self.music_leftonly, self.music_changed,  self.music_to_delete = self._compare_music()
 
     def _compare_files(self):
-        files_to_delete = self.rest_right.keys() - self.rest_left.keys()
+        left_keys = self.rest_left.keys()
+        right_keys = self.rest_right.keys()
+        files_to_delete = right_keys - left_keys
 
-        files_to_copy = []
-        for x in self.rest_left:
-            if x in self.rest_right:
-                if self.rest_left[x] != self.rest_right[x]:
-                    files_to_copy.append(x)
-            else:
-                files_to_copy.append(x)
+        files_to_copy = list(left_keys - right_keys)
+        files_to_copy.extend(x for x in left_keys & right_keys
+                             if abs(self.rest_left[x] - self.rest_right[x]) > mtime_tolerance_ns)
 
         return files_to_copy, files_to_delete
 
     def _compare_music(self):
-        music_to_delete = {k: v for k, v in self.music_right.items() if k not in self.music_left}
-
-        music_leftonly = []
-        music_changed = []
-        for x in self.music_left:
-            if x in self.music_right:
-                if self.music_left[x]['last_mod'] > self.music_right[x]['last_mod']:
-                    music_changed.append(x)
-            else:
-                music_leftonly.append(x)
+        left_keys = self.music_left.keys()
+        right_keys = self.music_right.keys()
+        music_to_delete = {k: self.music_right[k] for k in right_keys - left_keys}
+
+        music_leftonly = list(left_keys - right_keys)
+        music_changed = [x for x in left_keys & right_keys
+                         if self.music_left[x]['last_mod'] - self.music_right[x]['last_mod'] > mtime_tolerance_ns]
 
         return music_leftonly, music_changed, music_to_delete
 
     def synchronise(self):
-        self._copy_dirs()
-        self._copy_files()
-        self._copy_music_changed()
-        self._copy_music_leftonly()
-        self._remove_music()
-        self._remove_files()
-        self._remove_dirs()
+        for phase in (self._copy_dirs, self._copy_files, self._copy_music_changed, self._copy_music_leftonly,
+                      self._remove_music, self._remove_files, self._remove_dirs):
+            phase()
+            flush_log()
 
     def _copy_music_changed(self):
+        encode_jobs = []
         for x in self.music_changed:
             ext_left = self.music_left[x]['ext']
-            full_path_left = os.path.join(self.base_path_left, f'{x}{ext_left}')
+            full_path_left = self._left_prefix + x + ext_left
+            ext_right = self.music_right[x]['ext']
+            assert ext_right == '.mp3', 'Target file is not .mp3'
+            full_path_right = self._right_prefix + x + ext_right
+
             if ext_left.lower() == '.flac':
-                music_thing_left = flac.FLAC(full_path_left)
-                tags_left = music_thing_left.tags.as_dict()
+                tags_left = flac.FLAC(full_path_left).tags.as_dict()
             elif ext_left.lower() == '.mp3':
-                music_thing_left = mp3.MP3(full_path_left)
-                tags_left = id3_tags_as_dict(music_thing_left.tags)
+                # only the tags are needed, id3.ID3 doesn't parse the mpeg stream info like mp3.MP3 does
+                tags_left = id3_tags_as_dict(id3.ID3(full_path_left))
             else:
                 raise Exception('What is this thing?')
 
-            ext_right = self.music_right[x]['ext']
-            assert ext_right == '.mp3', 'Target file is not .mp3'
-            full_path_right = os.path.join(self.base_path_right, f'{x}{ext_right}')
             music_thing_right = mp3.MP3(full_path_right)
             tags_right = id3_tags_as_dict(music_thing_right.tags)
 
@@ -323,50 +499,64 @@ class CompResult:
 
             else:
                 if ext_left.lower() == '.flac':
-                    print_if_not_silent(f'encoding {full_path_left} to mp3')
-                    flac_to_mp3(full_path_left, full_path_right, tag_dict=tags_left)
+                    encode_jobs.append((full_path_left, full_path_right, tags_left))
+                elif same_file_content(full_path_left, full_path_right):
+                    # nothing changed, take over the mtime so the file isn't looked at again next time
+                    left_stat = os.stat(full_path_left)
+                    os.utime(full_path_right, ns=(left_stat.st_atime_ns, left_stat.st_mtime_ns))
                 else:
                     print_if_not_silent(f'copying {full_path_left} to right')
-                    shutil.copy2(full_path_left, full_path_right)
+                    copy_file(full_path_left, full_path_right)
+
+        encode_all(flac_to_mp3, encode_jobs)
 
     def _copy_music_leftonly(self):
+        encode_jobs = []
         for x in self.music_leftonly:
             ext_left = self.music_left[x]['ext']
-            full_path_left = os.path.join(self.base_path_left, f'{x}{ext_left}')
-            destination_path = os.path.join(self.base_path_right, f'{x}.mp3')
+            full_path_left = self._left_prefix + x + ext_left
+            destination_path = self._right_prefix + x + '.mp3'
 
             if ext_left.lower() == '.flac':
-                print_if_not_silent(f'encoding {full_path_left}')
-                flac_to_mp3(full_path_left, destination_path)
+                encode_jobs.append((full_path_left, destination_path))
 
             elif ext_left.lower() == '.mp3':
                 print_if_not_silent(f'copying {full_path_left}')
-                shutil.copy2(full_path_left, destination_path)
+                copy_file(full_path_left, destination_path)
             else:
                 raise Exception(f'What is this thing? - {x}{ext_left}')
 
+        encode_all(encode_new_flac, encode_jobs)
+
     def _remove_music(self):
+        paths = []
         for k, v in self.music_to_delete.items():
-            full_path = os.path.join(self.base_path_right, f"{k}{v['ext']}")
+            full_path = self._right_prefix + k + v['ext']
             print_if_not_silent(f'deleting {full_path}')
-            os.remove(full_path)
+            paths.append(full_path)
+        io_map(os.remove, paths)
 
     def _copy_files(self):
+        paths_source = []
+        paths_dest = []
         for f in self.rest_to_copy:
-            path_source = os.path.join(self.base_path_left, f)
-            path_dest = os.path.join(self.base_path_right, f)
+            path_source = self._left_prefix + f
             print_if_not_silent(f'copying {path_source} to right')
-            shutil.copy2(path_source, path_dest)
+            paths_source.append(path_source)
+            paths_dest.append(self._right_prefix + f)
+        io_map(copy_file, paths_source, paths_dest)
 
     def _remove_files(self):
+        paths = []
         for f in self.rest_to_delete:
-            path = os.path.join(self.base_path_right, f)
+            path = self._right_prefix + f
             print_if_not_silent(f'deleted {path}')
-            os.remove(path)
+            paths.append(path)
+        io_map(os.remove, paths)
 
     def _copy_dirs(self):
         for d in self.dirs_to_copy:
-            path = os.path.join(self.base_path_right, d)
+            path = self._right_prefix + d
             try:
                 os.makedirs(path)
             except FileExistsError:
@@ -374,11 +564,18 @@ class CompResult:
             print_if_not_silent(f'created {path}')
 
     def _remove_dirs(self):
-        dirs_aslist = [x for x, y in self.dirs_to_delete.items()]
-        for d in reversed(dirs_aslist):
-            path = os.path.join(self.base_path_right, d)
-            print_if_not_silent(f'removed {path}')
-            os.rmdir(path)
+        # subdirs must be gone before their parent, so remove one level at a time, deepest first
+        by_level = {}
+        for d, level in self.dirs_to_delete.items():
+            by_level.setdefault(level, []).append(d)
+
+        for level in sorted(by_level, reverse=True):
+            paths = []
+            for d in by_level[level]:
+                path = self._right_prefix + d
+                print_if_not_silent(f'removed {path}')
+                paths.append(path)
+            io_map(os.rmdir, paths)
 
 
 if __name__ == "__main__":